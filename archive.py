@@ -0,0 +1,109 @@
+"""
+Packs a version's test corpus (v{N}/tests and v{N}/fails) into one indexed
+archive file, so the tester can mmap a single file instead of opening three
+small files per test case.
+
+Usage: python3 archive.py <version>   # writes v{N}/corpus.pack
+
+Layout: MAGIC, an 8-byte little-endian index length, a JSON index mapping each
+file's path (as used by the test suite, e.g. "v1/tests/test_new.brewin") to
+[offset, length, mtime_ns]: its place within the data section, and the mtime of
+the loose file it was packed from. Then the data section itself.
+
+A packed file only counts as in the archive while its loose copy is either gone
+or unchanged (same size and mtime); edited files are read from disk instead, so
+a stale archive can't shadow them.
+"""
+
+import json
+import mmap
+import sys
+from os import listdir, stat
+from os.path import exists, isdir, join
+
+MAGIC = b"BREWINPACK2\n"
+ARCHIVE_NAME = "corpus.pack"
+CORPUS_DIRS = ("tests", "fails")
+CORPUS_EXTENSIONS = (".brewin", ".exp", ".in")
+
+
+def archive_path(version):
+    """Where the archive for a version lives."""
+    return f"v{version}/{ARCHIVE_NAME}"
+
+
+def pack_corpus(version, path=None):
+    """Pack every test file for a version into an archive; returns the file count."""
+    index, chunks, offset = {}, [], 0
+    for corpus in CORPUS_DIRS:
+        directory = f"v{version}/{corpus}/"
+        if not isdir(directory):
+            continue
+        for name in sorted(listdir(directory)):
+            if not name.endswith(CORPUS_EXTENSIONS):
+                continue
+            with open(join(directory, name), "rb") as handle:
+                data = handle.read()
+                mtime = stat(handle.fileno()).st_mtime_ns
+            index[f"{directory}{name}"] = [offset, len(data), mtime]
+            chunks.append(data)
+            offset += len(data)
+
+    encoded = json.dumps(index, sort_keys=True).encode()
+    with open(path or archive_path(version), "wb") as handle:
+        handle.write(MAGIC)
+        handle.write(len(encoded).to_bytes(8, "little"))
+        handle.write(encoded)
+        for chunk in chunks:
+            handle.write(chunk)
+    return len(index)
+
+
+class CorpusArchive:
+    """Read-only, memory-mapped view of a packed test corpus."""
+
+    def __init__(self, path):
+        with open(path, "rb") as handle:
+            self.buffer = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buffer[: len(MAGIC)] != MAGIC:
+            raise ValueError(
+                f"{path} is not a test corpus archive (or is outdated; re-run archive.py)"
+            )
+        start = len(MAGIC) + 8
+        length = int.from_bytes(self.buffer[len(MAGIC) : start], "little")
+        self.index = json.loads(self.buffer[start : start + length])
+        self.data_start = start + length
+
+    @classmethod
+    def open_for_version(cls, version):
+        """Open a version's archive, or return None if it hasn't been packed."""
+        path = archive_path(version)
+        return cls(path) if exists(path) else None
+
+    def __contains__(self, path):
+        if path not in self.index:
+            return False
+        _, length, mtime = self.index[path]
+        try:
+            current = stat(path)
+        except FileNotFoundError:
+            return True
+        return current.st_size == length and current.st_mtime_ns == mtime
+
+    def span(self, path):
+        """(start, end) byte offsets of a packed file within the buffer."""
+        offset, length, _ = self.index[path]
+        start = self.data_start + offset
+        return start, start + length
+
+    def read(self, path):
+        """Zero-copy memoryview of a packed file's contents."""
+        start, end = self.span(path)
+        return memoryview(self.buffer)[start:end]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        raise ValueError("Usage: python3 archive.py <version>")
+    count = pack_corpus(sys.argv[1])
+    print(f"Packed {count} files into {archive_path(sys.argv[1])}.")
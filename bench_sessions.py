@@ -0,0 +1,92 @@
+"""
+Load test for session.AsyncSession: runs many concurrent interactive sessions
+on a single event loop (i.e. one core) and reports throughput.
+
+Two workloads are measured: a public test that reads two lines of input, and a
+generated program that reads (and prints) many lines, whose sessions should cost
+time linear in the number of lines.
+
+Usage: python3 bench_sessions.py [sessions] [inputs] [version]
+"""
+
+import asyncio
+import importlib
+import random
+import sys
+import time
+
+from session import AsyncSession
+from tester import generate_test_suite
+
+MAX_INPUT_DELAY = 0.01  # seconds a simulated user takes to type each line
+SMALL_TEST = "Correctness | test_inputi"
+
+
+def load_test(version, name):
+    """Read a test's program and input lines."""
+    test = next(test for test in generate_test_suite(version) if test["name"] == name)
+    with open(test["srcfile"], encoding="utf-8") as handle:
+        program = handle.readlines()
+    try:
+        with open(test["inputfile"], encoding="utf-8") as handle:
+            lines = [line.rstrip("\n") for line in handle]
+    except FileNotFoundError:
+        lines = []
+    return program, lines
+
+
+def input_heavy_program(count):
+    """A program that reads and echoes count integers, with its input lines."""
+    program = ["(class main", " (field x 0)", " (method main ()", "  (begin"]
+    program += ["   (inputi x)", "   (print x)"] * count
+    program += ["  )", " )", ")"]
+    return program, [str(i) for i in range(count)]
+
+
+async def run_session(interpreter_lib, program, lines):
+    """Run one session against a simulated user typing lines; returns the session."""
+    pending = iter(lines)
+
+    async def read_input():
+        await asyncio.sleep(random.uniform(0, MAX_INPUT_DELAY))
+        return next(pending, None)
+
+    async def write_output(_value):
+        await asyncio.sleep(0)
+
+    session = AsyncSession(interpreter_lib, program, read_input, write_output)
+    await session.run()
+    return session
+
+
+async def load_test_workload(interpreter_lib, label, program, lines, count):
+    """Run count concurrent sessions of one program and report the results."""
+    start = time.perf_counter()
+    sessions = await asyncio.gather(
+        *(run_session(interpreter_lib, program, lines) for _ in range(count))
+    )
+    elapsed = time.perf_counter() - start
+
+    print(f"{count} concurrent sessions of {label} ({len(lines)} inputs) in {elapsed:.2f}s")
+    print(f"  {count / elapsed:10.1f} sessions/s on one core")
+    longest = max(session.longest_stall for session in sessions)
+    print(f"  {longest * 1000:10.2f} ms longest event-loop stall from one session")
+
+
+async def main():
+    """Load test the small and input-heavy workloads."""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    inputs = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    version = sys.argv[3] if len(sys.argv) > 3 else "1"
+    interpreter_lib = importlib.import_module(f"interpreterv{version}")
+
+    program, lines = load_test(version, SMALL_TEST)
+    await load_test_workload(interpreter_lib, repr(SMALL_TEST), program, lines, count)
+    program, lines = input_heavy_program(inputs)
+    await load_test_workload(
+        interpreter_lib, "an input-heavy program", program, lines, count
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+"""
+Benchmark tester.py startup: cold (a fresh process loads the interpreter and runs
+one test) versus warm (jobs go to an already-running `tester.py --serve`).
+
+Usage: python3 bench_startup.py [version] [repeats]
+"""
+
+import contextlib
+import io
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+from harness import request_test_results
+from tester import generate_test_suite
+
+OUTPUT = ".bench_results.json"
+
+
+def free_port():
+    """Ask the OS for a currently unused local port."""
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def time_process(args, repeats):
+    """Median wall-clock seconds to run tester.py with args to completion."""
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "tester.py", *args, "--output", OUTPUT],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def time_request(tests, port, repeats):
+    """Median wall-clock seconds for an in-process round trip to the server."""
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            request_test_results(tests, port)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def wait_for_server(port, timeout=10):
+    """Block until something accepts connections on port."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def main():
+    """Run both benchmarks for one test and report median latencies."""
+    version = sys.argv[1] if len(sys.argv) > 1 else "1"
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    test = generate_test_suite(version)[0]
+    name = test["name"]
+
+    cold = time_process([version, "--test", name], repeats)
+
+    port = free_port()
+    with subprocess.Popen(
+        [sys.executable, "tester.py", version, "--serve", str(port)],
+        stdout=subprocess.DEVNULL,
+    ) as server:
+        try:
+            wait_for_server(port)
+            client = time_process([version, "--test", name, "--connect", str(port)], repeats)
+            warm = time_request([test], port, repeats)
+        finally:
+            server.terminate()
+    if os.path.exists(OUTPUT):
+        os.remove(OUTPUT)
+
+    print(f"Startup latency for {name!r} (median of {repeats}):")
+    print(f"  cold (new process, local run):    {cold * 1000:8.2f} ms")
+    print(f"  warm (new process, --connect):    {client * 1000:8.2f} ms")
+    print(f"  warm (in-process round trip):     {warm * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
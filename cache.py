@@ -0,0 +1,150 @@
+"""
+Optional on-disk result cache, so unchanged test cases aren't re-run.
+
+Results are stored in SQLite, keyed by a hash of the interpreter's source (and
+the local modules it imports) plus the contents of the test case's files.
+"""
+
+import ast
+import hashlib
+import sqlite3
+import time
+from os import makedirs
+from os.path import dirname, exists, join
+
+DEFAULT_CACHE_DIR = ".grader_cache"
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_MAX_AGE = 7 * 24 * 60 * 60  # one week, in seconds
+
+TEST_FILE_KEYS = ("srcfile", "expfile", "inputfile")
+
+
+def __local_imports(path):
+    """Return paths of modules imported by the file at path that live next to it."""
+    with open(path, encoding="utf-8") as handle:
+        tree = ast.parse(handle.read(), path)
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module.split(".")[0])
+    candidates = (join(dirname(path), f"{name}.py") for name in sorted(names))
+    return [candidate for candidate in candidates if exists(candidate)]
+
+
+def local_module_paths(path):
+    """Sorted paths of a module's file and every local module it (transitively) imports."""
+    pending, seen = [path], set()
+    while pending:
+        path = pending.pop()
+        if path in seen:
+            continue
+        seen.add(path)
+        pending.extend(__local_imports(path))
+    return sorted(seen)
+
+
+def hash_module_sources(module):
+    """Hash a module's source along with every local module it (transitively) imports."""
+    digest = hashlib.sha256()
+    for path in local_module_paths(module.__file__):
+        with open(path, "rb") as handle:
+            digest.update(handle.read())
+    return digest.hexdigest()
+
+
+def hash_test_case(test_case, archive=None):
+    """
+    Hash the contents of a test case's files (missing files hash distinctly),
+    reading each from a CorpusArchive if it is packed (and current) there, as the
+    scaffold does.
+    """
+    digest = hashlib.sha256()
+    digest.update(repr(test_case.get("expect_failure", False)).encode())
+    for key in TEST_FILE_KEYS:
+        digest.update(key.encode())
+        if archive is not None and test_case.get(key) in archive:
+            digest.update(b"\x01" + archive.read(test_case[key]))
+            continue
+        try:
+            with open(test_case[key], "rb") as handle:
+                digest.update(b"\x01" + handle.read())
+        except (KeyError, FileNotFoundError):
+            digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    SQLite-backed cache of test scores, evicting entries by count and by age.
+    Entries are keyed on the interpreter fingerprint, so any change to the
+    interpreter (or its local imports) invalidates every cached result, and on
+    the timeout the test ran under, so a pass under a looser timeout isn't reused.
+    """
+
+    def __init__(
+        self,
+        fingerprint,
+        directory=DEFAULT_CACHE_DIR,
+        max_entries=DEFAULT_MAX_ENTRIES,
+        max_age=DEFAULT_MAX_AGE,
+        archive=None,
+    ):
+        if not exists(directory):
+            makedirs(directory)
+        self.fingerprint = fingerprint
+        self.archive = archive
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.connection = sqlite3.connect(join(directory, "results.sqlite3"))
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS results "
+            "(key TEXT PRIMARY KEY, score REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.evict()
+
+    def key(self, test_case, timeout):
+        """Cache key for a test case run under the current interpreter and timeout."""
+        return f"{self.fingerprint}:{timeout!r}:{hash_test_case(test_case, self.archive)}"
+
+    def get(self, test_case, timeout):
+        """Return the cached score for a test case, or None on a miss."""
+        key = self.key(test_case, timeout)
+        row = self.connection.execute(
+            "SELECT score FROM results WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        with self.connection:
+            self.connection.execute(
+                "UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+        self.hits += 1
+        return int(row[0]) if row[0].is_integer() else row[0]
+
+    def put(self, test_case, timeout, score):
+        """Record the score for a test case."""
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                (self.key(test_case, timeout), score, time.time()),
+            )
+
+    def evict(self):
+        """Drop entries unused for max_age seconds, then all but the max_entries newest."""
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM results WHERE last_used < ?",
+                (time.time() - self.max_age,),
+            )
+            self.connection.execute(
+                "DELETE FROM results WHERE key NOT IN "
+                "(SELECT key FROM results ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+
+    def close(self):
+        """Close the underlying database."""
+        self.connection.close()
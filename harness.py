@@ -1,15 +1,39 @@
 """
 Platform-agnostic test harness, with ABC for test scaffold and asyncio-based
 test management.
+
+asyncio is loaded lazily (on first use, i.e. when an entry point starts an event
+loop), so entry points that never run tests locally, like merging shards or
+talking to a test server, start quickly; see bench_startup.py.
 """
 
-import asyncio
+import hashlib
+import importlib.util
 import json
+import sys
+import time
 from os import makedirs
-from os.path import exists
+from os.path import exists, getmtime
 from abc import ABC, abstractmethod
 
 
+def lazy_import(name):
+    """Return a module whose code only runs on first attribute access."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+asyncio = lazy_import("asyncio")
+
+DEFAULT_MAX_ABANDONED = 4  # timed-out test threads a server tolerates before recycling
+
+
 class AbstractTestScaffold(ABC):
     """ABC for test scaffold"""
 
@@ -32,43 +56,283 @@ def run_test(scaffold, test_case):
         return 0
 
 
-async def run_test_wrapper(interpreter, test_case, timeout):
+async def run_test_wrapper(
+    interpreter, test_case, timeout, cache=None, runtimes=None, executor=None, abandoned=None
+):
     """
     Wrapper for run_test with timeout and minor debugging.
     Uses asyncio to enforce timeout, not for concurrency.
+    If a cache is given, cached scores are reused and new (non-timeout) scores stored.
+    If a runtimes dict is given, the wall-clock time of completed runs is recorded in it.
+    The test runs on a thread of executor (by default, the event loop's). A timed-out
+    thread can't be stopped, so if an abandoned set is given, the futures of timed-out
+    runs are kept in it until their threads finish.
     """
     print(f'Running {test_case["srcfile"]}... ', end="")
+    if cache is not None:
+        result = cache.get(test_case, timeout)
+        if result is not None:
+            print(f' {"PASSED" if result else "FAILED"} (cached)')
+            return result
+    start = time.perf_counter()
+    worker = asyncio.get_running_loop().run_in_executor(
+        executor, run_test, interpreter, test_case
+    )
     try:
         async with asyncio.timeout(timeout):
-            result = await asyncio.to_thread(run_test, interpreter, test_case)
+            # shielded, so that timing out leaves worker tracking the thread
+            result = await asyncio.shield(worker)
+            if runtimes is not None:
+                runtimes[test_case["name"]] = time.perf_counter() - start
             print(f' {"PASSED" if result else "FAILED"}')
+            if cache is not None:
+                cache.put(test_case, timeout, result)
             return result
     except asyncio.TimeoutError:
         print("TIMED OUT")
+        if abandoned is not None and not worker.done():
+            abandoned.add(worker)
+            worker.add_done_callback(abandoned.discard)
         return 0
 
 
-async def run_all_tests(interpreter, tests, timeout_per_test=5):
+async def run_all_tests(
+    interpreter, tests, timeout_per_test=5, cache=None, runtimes=None, timeouts=None
+):
     """
     Run all tests sequentially; defaults to 5s timeout per test.
     Each test case *must* have a name and srcfile key.
+    Pass a ResultCache to skip test cases whose results are already cached, and
+    a dict as runtimes to collect per-test wall-clock times (in seconds).
+    Per-test timeouts in a timeouts dict (name -> seconds) override timeout_per_test.
     """
+    timeouts = timeouts or {}
     print(f"Running {len(tests)} tests...")
+    hits_before = cache.hits if cache is not None else 0
     results = [
-        {
-            "name": test["name"],
-            "score": await run_test_wrapper(interpreter, test, timeout_per_test),
-            "max_score": 1,
-            "visibility": "visible"
-            if test.get("visible", False)
-            else "after_published",
-        }
+        format_test_result(
+            test,
+            await run_test_wrapper(
+                interpreter,
+                test,
+                timeouts.get(test["name"], timeout_per_test),
+                cache,
+                runtimes,
+            ),
+        )
         for test in tests
     ]
     print(f"{get_score(results)}/{len(tests)} tests passed.")
+    if cache is not None:
+        print(f"{cache.hits - hits_before}/{len(tests)} results served from cache.")
     return results
 
 
+async def serve_tests(
+    interpreter,
+    tests,
+    port,
+    host="127.0.0.1",
+    timeout_per_test=5,
+    timeouts=None,
+    max_abandoned=DEFAULT_MAX_ABANDONED,
+):
+    """
+    Serve test jobs over a local socket, so that clients skip interpreter startup.
+    Clients send one JSON object with a test "name" per line; each gets a line
+    back with that test's result (as in run_all_tests) or an "error".
+    Tests run on a pool of max_abandoned + 1 threads. Timed-out tests keep their
+    thread busy, so once max_abandoned of them are still running, the server
+    closes every connection and returns True; the caller should then replace the
+    process, which is the only way to reclaim those threads.
+    """
+    from concurrent.futures import ThreadPoolExecutor  # pylint: disable=import-outside-toplevel
+
+    by_name = {test["name"]: test for test in tests}
+    timeouts = timeouts or {}
+    executor = ThreadPoolExecutor(max_abandoned + 1)
+    abandoned = set()
+    writers = set()
+    recycle = asyncio.Event()
+
+    async def handle(reader, writer):
+        writers.add(writer)
+        async for line in reader:
+            try:
+                test = by_name[json.loads(line)["name"]]
+            except (ValueError, KeyError, TypeError):
+                response = {"error": f"Unknown test job: {line.strip()!r}"}
+            else:
+                score = await run_test_wrapper(
+                    interpreter,
+                    test,
+                    timeouts.get(test["name"], timeout_per_test),
+                    executor=executor,
+                    abandoned=abandoned,
+                )
+                response = format_test_result(test, score)
+            writer.write(json.dumps(response).encode() + b"\n")
+            await writer.drain()
+            if len(abandoned) >= max_abandoned:
+                recycle.set()
+        writers.discard(writer)
+        writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    print(f"Serving {len(tests)} tests on {host}:{port}...", flush=True)
+    async with server:
+        await recycle.wait()
+        for writer in writers:
+            writer.close()
+    executor.shutdown(wait=False)
+    print(f"{len(abandoned)} timed-out tests are still running; recycling.", flush=True)
+    return True
+
+
+def snapshot_mtimes(paths):
+    """Map each path to its mtime (None if it doesn't exist)."""
+    mtimes = {}
+    for path in paths:
+        try:
+            mtimes[path] = getmtime(path)
+        except OSError:
+            mtimes[path] = None
+    return mtimes
+
+
+async def wait_for_changes(mtimes, interval=0.5):
+    """Poll until any watched path changes; returns the changed paths and new mtimes."""
+    while True:
+        await asyncio.sleep(interval)
+        current = snapshot_mtimes(mtimes)
+        changed = {path for path in mtimes if current[path] != mtimes[path]}
+        if changed:
+            return changed, current
+
+
+async def run_unless(coroutine, interrupt):
+    """
+    Run coroutine until it finishes or interrupt does, cancelling coroutine (and
+    waiting for it to wind down) in the latter case. Returns whether coroutine
+    finished, and the (still running) interrupt task.
+    """
+    task = asyncio.create_task(coroutine)
+    interrupt_task = asyncio.ensure_future(interrupt)
+    await asyncio.wait({task, interrupt_task}, return_when=asyncio.FIRST_COMPLETED)
+    if not task.done():
+        task.cancel()
+        await asyncio.wait({task})
+        return False, interrupt_task
+    task.result()  # re-raise anything coroutine raised
+    return True, interrupt_task
+
+
+async def run_process(command, env=None):
+    """
+    Run a command to completion, with output going to ours; returns its exit code.
+    If cancelled, the process is killed (and reaped) first.
+    """
+    process = await asyncio.create_subprocess_exec(*command, env=env)
+    try:
+        return await process.wait()
+    except asyncio.CancelledError:
+        process.kill()
+        await process.wait()
+        raise
+
+
+def request_test_results(tests, port, host="127.0.0.1"):
+    """Run tests on a serve_tests server; returns results as run_all_tests would."""
+    import socket  # pylint: disable=import-outside-toplevel
+
+    print(f"Running {len(tests)} tests on {host}:{port}...")
+    results = []
+    with socket.create_connection((host, port)) as connection:
+        with connection.makefile("rwb") as stream:
+            for test in tests:
+                print(f'Running {test["srcfile"]}... ', end="")
+                stream.write(json.dumps({"name": test["name"]}).encode() + b"\n")
+                stream.flush()
+                response = json.loads(stream.readline())
+                if "error" in response:
+                    raise ValueError(response["error"])
+                print(f' {"PASSED" if response["score"] else "FAILED"}')
+                results.append(response)
+    print(f"{get_score(results)}/{len(tests)} tests passed.")
+    return results
+
+
+def derive_timeouts(runtimes, multiplier=10, floor=1, ceiling=10):
+    """
+    Derive per-test timeouts from reference runtimes (name -> seconds): each test
+    gets multiplier times its reference runtime, clamped to [floor, ceiling].
+    """
+    return {
+        name: min(max(runtime * multiplier, floor), ceiling)
+        for name, runtime in runtimes.items()
+    }
+
+
+def shard_tests(tests, index, count, runtimes=None):
+    """
+    Deterministically pick shard index (0-based) of count from tests.
+    By default, tests are assigned by a stable hash of their name. Given a dict of
+    historical runtimes (name -> seconds), tests are instead greedily balanced so
+    every shard gets a similar total runtime; unknown tests count as the mean.
+    Either way, every test lands in exactly one shard, in its original order.
+    """
+    if not 0 <= index < count:
+        raise ValueError(f"Shard index {index} out of range for {count} shards")
+    if not runtimes:
+        return [
+            test
+            for test in tests
+            if int(hashlib.sha256(test["name"].encode()).hexdigest(), 16) % count
+            == index
+        ]
+
+    known = [runtimes[test["name"]] for test in tests if test["name"] in runtimes]
+    default = sum(known) / len(known) if known else 1.0
+    loads = [0.0] * count
+    assignment = {}
+    for test in sorted(
+        tests, key=lambda test: (-runtimes.get(test["name"], default), test["name"])
+    ):
+        shard = loads.index(min(loads))
+        loads[shard] += runtimes.get(test["name"], default)
+        assignment[test["name"]] = shard
+    return [test for test in tests if assignment[test["name"]] == index]
+
+
+def merge_shard_results(outputs, tests):
+    """
+    Combine per-shard gradescope outputs into the results of a single unsharded run.
+    Results are put back into suite order; every test must appear exactly once.
+    """
+    by_name = {}
+    for output in outputs:
+        for result in output["tests"]:
+            if result["name"] in by_name:
+                raise ValueError(f"Duplicate result for {result['name']}")
+            by_name[result["name"]] = result
+    names = [test["name"] for test in tests]
+    missing = [name for name in names if name not in by_name]
+    extra = sorted(set(by_name) - set(names))
+    if missing or extra:
+        raise ValueError(f"Shards do not cover suite; missing {missing}, extra {extra}")
+    return [by_name[name] for name in names]
+
+
+def format_test_result(test, score):
+    """Generate the gradescope result for a single 0/1-scored test case."""
+    return {
+        "name": test["name"],
+        "score": score,
+        "max_score": 1,
+        "visibility": "visible" if test.get("visible", False) else "after_published",
+    }
+
+
 def format_gradescope_output(results):
     """Generate proper JSON object depending on results type."""
     if isinstance(results, (int, float)):
@@ -76,14 +340,14 @@ def format_gradescope_output(results):
     return {"tests": results}
 
 
-def write_gradescope_output(score, is_prod):
+def write_gradescope_output(score, is_prod, filename="results.json"):
     """Write a results.json with the score; use CWD on dev, root on prod."""
     path = "/autograder/results" if is_prod else "."
     data = format_gradescope_output(score)
     if not exists(path):
         print(f"{path} does not exist, creating...")
         makedirs(path)
-    with open(f"{path}/results.json", "w", encoding="utf-8") as handle:
+    with open(f"{path}/{filename}", "w", encoding="utf-8") as handle:
         json.dump(data, handle, ensure_ascii=False, indent=4)
 
 
@@ -6,7 +6,9 @@ When grading, we will use our own copy of intbase; you should not submit a copy
 or make any changes to your local copy!
 """
 
+import re
 from enum import Enum
+from os import PathLike
 from bparser import BParser
 
 
@@ -21,6 +23,72 @@ class ErrorType(Enum):
     FAULT_ERROR = 4  # used if an object reference is null and used to make a call
 
 
+class FileInput:
+    """
+    Input source that lazily reads lines from a file, instead of holding all of
+    them in memory; readline() returns None once the file is exhausted.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.handle = None
+        self.exhausted = False
+
+    def readline(self):
+        """Return the next line (without its newline), or None at end of input."""
+        if self.exhausted:
+            return None
+        if self.handle is None:
+            self.handle = open(self.path, encoding="utf-8")  # pylint: disable=consider-using-with
+        line = self.handle.readline()
+        if not line:
+            self.close()
+            self.exhausted = True
+            return None
+        return line.rstrip("\n")
+
+    def rewind(self):
+        """Start reading again from the top of the file."""
+        self.close()
+        self.exhausted = False
+
+    def close(self):
+        """Close the underlying file, if open."""
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+
+class BufferInput:
+    """
+    Input source that reads lines out of a bytes-like buffer (e.g. an mmap) or a
+    slice of one, without copying it; readline() returns None once it is exhausted.
+    """
+
+    # the line endings FileInput's universal newlines mode recognizes
+    NEWLINE = re.compile(rb"\r\n|\r|\n")
+
+    def __init__(self, buffer, start=0, end=None):
+        self.buffer = buffer
+        self.view = memoryview(buffer)
+        self.start = start
+        self.end = len(buffer) if end is None else end
+        self.position = start
+
+    def readline(self):
+        """Return the next line (without its newline), or None at end of input."""
+        if self.position >= self.end:
+            return None
+        newline = self.NEWLINE.search(self.buffer, self.position, self.end)
+        start = self.position
+        stop, self.position = (self.end, self.end) if newline is None else newline.span()
+        return str(self.view[start:stop], "utf-8")
+
+    def rewind(self):
+        """Start reading again from the top of the buffer."""
+        self.position = self.start
+
+
 class InterpreterBase:
     """
     Base class for the interpreter; your implementation should subclass InterpreterBase.
@@ -60,10 +128,19 @@ class InterpreterBase:
     EXCEPTION_VARIABLE_DEF = "exception"
     TYPE_CONCAT_CHAR = "@"
 
+    # set to True in subclasses whose reset() clears all execution state, so that
+    # one instance can run many programs (or one program with many inputs)
+    REUSABLE = False
+
+    # yielded by subclasses' start(program), a run that can be suspended, when the
+    # program needs a line of input; the caller sends the line (or None) back in
+    NEED_INPUT = "need input"
+
     # methods
     def __init__(self, console_output=True, inp=None):
         self.console_output = console_output
-        self.inp = inp  # if not none, then read input from passed-in list
+        self.inp = None
+        self.set_input(inp)
         self.output_log = []
         self.input_cursor = 0
         self.error_type = None
@@ -77,6 +154,18 @@ class InterpreterBase:
         self.input_cursor = 0
         self.error_type = None
         self.error_line = None
+        if hasattr(self.inp, "rewind"):
+            self.inp.rewind()
+
+    def set_input(self, inp):
+        """
+        Read input from inp for subsequent runs: a list of lines, an input source
+        (with readline()), a file path, or None to read from the keyboard.
+        """
+        if isinstance(inp, (str, PathLike)):
+            inp = FileInput(inp)
+        self.inp = inp
+        self.input_cursor = 0
 
     def run(self, program):
         """Run a program. You need to implement this in your derived class!"""
@@ -88,6 +177,9 @@ class InterpreterBase:
         if not self.inp:
             return input()  # Get input from keyboard if not input list provided
 
+        if hasattr(self.inp, "readline"):
+            return self.inp.readline()
+
         if self.input_cursor < len(self.inp):
             cur_input = self.inp[self.input_cursor]
             self.input_cursor += 1
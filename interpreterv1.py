@@ -4,47 +4,115 @@ from bparser import BParser
 
 
 class Interpreter(InterpreterBase):
-    def __init__(self, console_output=True, inp=None, trace_output=False):
+    REUSABLE = True
+    MAX_CACHED_PROGRAMS = 16
+    STEPS_PER_YIELD = 1000  # statements a started run executes between yields
+
+    def __init__(self, console_output=True, inp=None, trace_output=False, lazy_classes=True):
         super().__init__(console_output, inp)   # call InterpreterBase’s constructor
+        self.lazy_classes = lazy_classes
+        self.class_index = {}   # class name -> parsed top-level form
+        self.class_defs = {}    # class name -> materialized ClassDefinition
+        # program source -> (class_index, class_defs), so reruns skip parsing
+        self.class_table_cache = {}
+        self.steps = 0  # statements executed by the current run
+
+    def reset(self):
+        super().reset()
+        self.steps = 0
+        self.class_index = {}
         self.class_defs = {}
 
     def run(self, program):
+        execution = self.start(program)
+        line = None
+        while True:
+            try:
+                request = execution.send(line)
+            except StopIteration:
+                return
+            line = self.get_input() if request is InterpreterBase.NEED_INPUT else None
+
+    # a run that can be suspended: yields NEED_INPUT when the program reads a line,
+    # which must be sent back in, and None every STEPS_PER_YIELD statements
+    def start(self, program):
+        key = tuple(program)
+        if key in self.class_table_cache:
+            self.class_index, self.class_defs = self.class_table_cache[key]
+        elif not self.__index_classes(program):
+            return  # error
+        else:
+            if len(self.class_table_cache) >= self.MAX_CACHED_PROGRAMS:
+                del self.class_table_cache[next(iter(self.class_table_cache))]
+            self.class_table_cache[key] = (self.class_index, self.class_defs)
+        if not self.lazy_classes:
+            self.get_class_def()
+        main_class = self.get_class("main")
+        if main_class is None:
+            raise KeyError("main")
+        main_object = yield from main_class.instantiate_object()
+        yield from main_object.call_method("main", [])
+
+    def __index_classes(self, program):
         result, parsed_program = BParser.parse(program)
         if result == False:
-            return  # error
+            return False
+        self.class_index = {}
+        self.class_defs = {}
+        # index classes by name, checking for malformed items and duplicates in
+        # the same order a full build would, so lazy and eager runs reject the
+        # same programs; ClassDefinitions are only built once needed
         for class_def in parsed_program:
             class_name = class_def[1]
-            class_methods = []
-            class_fields = []
+            field_names = set()
+            method_names = set()
             for item in class_def[2:]:
                 if item[0] == 'field':
                     field_name, initial_value = item[1:]
-                    for i in class_fields:
-                        if (i.field_name == field_name):
-                            self.error(ErrorType.NAME_ERROR)
-                    class_fields.append(FieldDefinition(
-                        field_name, initial_value))
+                    if (field_name in field_names):
+                        self.error(ErrorType.NAME_ERROR)
+                    field_names.add(field_name)
                 elif item[0] == 'method':
-                    method_name = item[1]
-                    params = item[2]
-                    statement = item[3]
-                    for i in class_methods:
-                        if (i.method_name == method_name):
-                            self.error(ErrorType.NAME_ERROR)
-                    class_methods.append(MethodDefinition(
-                        method_name, params, statement))
-            new_class_def = ClassDefinition(
-                class_name, class_methods, class_fields, self)
-            if (class_name in self.class_defs):
+                    method_name, params, statement = item[1], item[2], item[3]
+                    if (method_name in method_names):
+                        self.error(ErrorType.NAME_ERROR)
+                    method_names.add(method_name)
+            if (class_name in self.class_index):
                 self.error(ErrorType.TYPE_ERROR)
             else:
-                self.class_defs[class_name] = new_class_def
-        main_class = self.class_defs["main"]
-        main_class.instantiate_object().call_method("main", [])
+                self.class_index[class_name] = class_def
+        return True
+
+    def get_class(self, class_name):
+        if class_name not in self.class_defs:
+            if class_name not in self.class_index:
+                return None
+            self.class_defs[class_name] = self.__build_class(
+                self.class_index[class_name])
+        return self.class_defs[class_name]
 
     def get_class_def(self):
+        for class_name in self.class_index:
+            self.get_class(class_name)
         return self.class_defs
 
+    def __build_class(self, class_def):
+        class_methods = []
+        class_fields = []
+        for item in class_def[2:]:
+            if item[0] == 'field':
+                field_name, initial_value = item[1:]
+                class_fields.append(FieldDefinition(
+                    field_name, initial_value))
+            elif item[0] == 'method':
+                method_name = item[1]
+                params = item[2]
+                statement = item[3]
+                class_methods.append(MethodDefinition(
+                    method_name, params, statement))
+        return ClassDefinition(
+            class_def[1], class_methods, class_fields, self)
+
 
 class FieldDefinition:
     def __init__(self, field_name, initial_value):
@@ -80,7 +148,7 @@ class ClassDefinition:
         for method in self.methods:
             obj.add_method(method)
         for field in self.fields:
-            obj.add_field(field.field_name, field.initial_value)
+            yield from obj.add_field(field.field_name, field.initial_value)
         return obj
 
 
@@ -94,7 +162,7 @@ class ObjectDefinition:
     def add_field(self, field_name, initial_value):
         expression = Expression(
             initial_value, self, self.interpreter)
-        value = expression.evaluate_expression()
+        value = yield from expression.evaluate_expression()
         self.fields[field_name] = value
 
     def add_method(self, method):
@@ -108,27 +176,30 @@ class ObjectDefinition:
         else:
             for i in range(0, len(method.params)):
                 self.parameters[method.params[i]] = parameters[i]
-        result = self.__run_statement(statement)
+        result = yield from self.__run_statement(statement)
         return result
 
     def __run_statement(self, statement):
         result = None
+        self.interpreter.steps += 1
+        if self.interpreter.steps % self.interpreter.STEPS_PER_YIELD == 0:
+            yield  # let whoever drives the run check its budget
         if statement[0] == InterpreterBase.PRINT_DEF:
-            result = self.__execute_print_statement(statement)
+            result = yield from self.__execute_print_statement(statement)
         elif statement[0] == InterpreterBase.INPUT_INT_DEF or statement[0] == InterpreterBase.INPUT_STRING_DEF:
-            result = self.__execute_input_statement(statement)
+            result = yield from self.__execute_input_statement(statement)
         elif statement[0] == InterpreterBase.CALL_DEF:
-            result = self.__execute_call_statement(statement)
+            result = yield from self.__execute_call_statement(statement)
         elif statement[0] == InterpreterBase.WHILE_DEF:
-            result = self.__execute_while_statement(statement)
+            result = yield from self.__execute_while_statement(statement)
         elif statement[0] == InterpreterBase.IF_DEF:
-            result = self.__execute_if_statement(statement)
+            result = yield from self.__execute_if_statement(statement)
         elif statement[0] == InterpreterBase.RETURN_DEF:
-            result = self.__execute_return_statement(statement)
+            result = yield from self.__execute_return_statement(statement)
         elif statement[0] == InterpreterBase.BEGIN_DEF:
-            result = self.__execute_begin_statement(statement)
+            result = yield from self.__execute_begin_statement(statement)
         elif statement[0] == InterpreterBase.SET_DEF:
-            result = self.__execute_set_statement(statement)
+            result = yield from self.__execute_set_statement(statement)
         return result
 
     def __execute_print_statement(self, statement):
@@ -136,7 +207,7 @@ class ObjectDefinition:
         for i in statement[1:]:
             expression = Expression(
                 i, self, self.interpreter)
-            value = expression.evaluate_expression()
+            value = yield from expression.evaluate_expression()
             if value is True:
                 value = 'true'
             elif value is False:
@@ -154,9 +225,10 @@ class ObjectDefinition:
         return
 
     def __execute_input_statement(self, statement):
+        line = yield InterpreterBase.NEED_INPUT
         expression = Expression(
-            self.interpreter.get_input(), self, self.interpreter)
-        value = expression.evaluate_expression()
+            line, self, self.interpreter)
+        value = yield from expression.evaluate_expression()
         if statement[1] in self.fields:
             self.fields[statement[1]] = value
         return
@@ -167,23 +239,23 @@ class ObjectDefinition:
         for i in statement[3:]:
             param = Expression(
                 i, self, self.interpreter)
-            values.append(param.evaluate_expression())
+            values.append((yield from param.evaluate_expression()))
 
         if statement[1] == 'me':
             if statement[2] in self.methods:
-                if (self.call_method(statement[2], parameters=values)) is not None:
-                    value = self.call_method(statement[2], parameters=values)
+                if (yield from self.call_method(statement[2], parameters=values)) is not None:
+                    value = yield from self.call_method(statement[2], parameters=values)
             else:
                 self.interpreter.error(ErrorType.NAME_ERROR)
         else:
             expression = Expression(
                 statement[1], self, self.interpreter)
-            class_name = expression.evaluate_expression()
+            class_name = yield from expression.evaluate_expression()
             if class_name == 'null':
                 self.interpreter.error(ErrorType.FAULT_ERROR)
             if statement[2] in class_name.methods:
-                if (class_name.call_method(statement[2], parameters=values)) is not None:
-                    value = class_name.call_method(
+                if (yield from class_name.call_method(statement[2], parameters=values)) is not None:
+                    value = yield from class_name.call_method(
                         statement[2], parameters=values)
             else:
                 self.interpreter.error(ErrorType.NAME_ERROR)
@@ -191,15 +263,15 @@ class ObjectDefinition:
 
     def __execute_while_statement(self, statement):
         result = None
-        condition = (Expression(
+        condition = (yield from Expression(
             statement[1], self, self.interpreter).evaluate_expression())
         if type(condition) != bool:
             self.interpreter.error(ErrorType.TYPE_ERROR)
         if condition:
-            result = self.__run_statement(statement[2])
+            result = yield from self.__run_statement(statement[2])
             if (result == ""):
                 return result
-            self.__execute_while_statement(statement)
+            yield from self.__execute_while_statement(statement)
         else:
             return result
 
@@ -207,28 +279,28 @@ class ObjectDefinition:
         result = None
         expression = Expression(
             statement[1], self, self.interpreter)
-        condition = expression.evaluate_expression()
+        condition = yield from expression.evaluate_expression()
         if type(condition) != bool:
             self.interpreter.error(ErrorType.TYPE_ERROR)
         if condition:
-            result = self.__run_statement(statement[2])
+            result = yield from self.__run_statement(statement[2])
         else:
             if len(statement) > 3:
-                result = self.__run_statement(statement[3])
+                result = yield from self.__run_statement(statement[3])
         return result
 
     def __execute_return_statement(self, statement):
         if (len(statement)) > 1:
             expression = Expression(
                 statement[1], self, self.interpreter)
-            value = expression.evaluate_expression()
+            value = yield from expression.evaluate_expression()
             return value
         else:
             return ""
 
     def __execute_begin_statement(self, statement):
         for i in statement[1:]:
-            result = self.__run_statement(i)
+            result = yield from self.__run_statement(i)
             if result != None:
                 return result
         return
@@ -236,7 +308,7 @@ class ObjectDefinition:
     def __execute_set_statement(self, statement):
         expression = Expression(
             statement[2], self, self.interpreter)
-        value = expression.evaluate_expression()
+        value = yield from expression.evaluate_expression()
         if statement[1] in self.fields:
             self.fields[statement[1]] = value
         elif statement[1] in self.parameters:
@@ -272,9 +344,9 @@ class Expression():
                     '&': lambda x, y: x and y,
                     '|': lambda x, y: x or y,
                 }[op]
-                arg1 = Expression(
+                arg1 = yield from Expression(
                     self.expression[1], self.object, self.interpreter).evaluate_expression()
-                arg2 = Expression(
+                arg2 = yield from Expression(
                     self.expression[2],  self.object, self.interpreter).evaluate_expression()
                 if (arg1 == 'null' or arg2 == 'null'):
                     if arg1 == 'null' and arg2 == 'null':
@@ -296,21 +368,20 @@ class Expression():
                     return self.interpreter.error(ErrorType.TYPE_ERROR)
                 result = op_func(arg1, arg2)
             elif op == '!':
-                arg = Expression(
+                arg = yield from Expression(
                     self.expression[1],  self.object, self.interpreter).evaluate_expression()
                 if type(arg) != bool:
                     self.interpreter.error(ErrorType.TYPE_ERROR)
                 return not arg
             elif op == 'new':
-                class_defs = self.interpreter.get_class_def()
-                if self.expression[1] in class_defs:
-                    new_obj = class_defs[self.expression[1]
-                                         ].instantiate_object()
+                class_def = self.interpreter.get_class(self.expression[1])
+                if class_def is not None:
+                    new_obj = yield from class_def.instantiate_object()
                 else:
                     self.interpreter.error(ErrorType.TYPE_ERROR)
                 result = new_obj
             elif op == 'call':
-                value = self.object._ObjectDefinition__execute_call_statement(
+                value = yield from self.object._ObjectDefinition__execute_call_statement(
                     self.expression)
                 result = value
         else:
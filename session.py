@@ -0,0 +1,84 @@
+"""
+Asyncio-native interactive sessions: inputi/inputs await an async input source
+and output goes to an async sink, so one event loop can host many concurrent
+Brewin programs, each with its own I/O channel.
+
+A session drives the interpreter's start(program), a run that can be suspended
+(see interpreterv1.py), rather than run(program). When the program reads a line,
+the run is suspended while the line is awaited, then resumed where it left off,
+so a program reading k lines still runs once. Every STEPS_PER_YIELD statements
+the run also hands control back to the event loop, so one session's computation
+only briefly holds up the others; longest_stall records the worst such pause.
+
+Each session has a step budget; a program that executes more statements than
+that (e.g. one stuck in a loop) fails the session with StepLimitExceeded; the
+budget is checked each time the run yields.
+"""
+
+import asyncio
+import time
+
+DEFAULT_MAX_STEPS = 1_000_000  # statements a session may execute
+
+
+class StepLimitExceeded(RuntimeError):
+    """Raised when a session's program executes more statements than its budget."""
+
+
+class AsyncSession:
+    """
+    One interactive run of a Brewin program. read_input is an async callable
+    returning the next line of input (or None at end of input); write_output is
+    an async callable receiving each value the program outputs, in order, each
+    time the run is suspended (so before every read, and at least every
+    STEPS_PER_YIELD statements).
+    """
+
+    def __init__(
+        self, interpreter_lib, program, read_input, write_output, max_steps=DEFAULT_MAX_STEPS
+    ):
+        self.interpreter_lib = interpreter_lib
+        self.program = program
+        self.read_input = read_input
+        self.write_output = write_output
+        self.max_steps = max_steps
+        self.sent = 0  # values of the output log already written
+        self.longest_stall = 0.0  # seconds the event loop was blocked by this session
+
+    async def run(self):
+        """Run the program to completion; returns its full output log."""
+        interpreter = self.interpreter_lib.Interpreter(False, None, False)
+        if not hasattr(interpreter, "start"):
+            raise TypeError(f"{self.interpreter_lib.__name__} can't suspend a run")
+        execution = interpreter.start(self.program)
+        line = None
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    request = execution.send(line)
+                except StopIteration:
+                    return interpreter.get_output()
+                finally:
+                    self.longest_stall = max(
+                        self.longest_stall, time.perf_counter() - start
+                    )
+                    await self.flush(interpreter)
+                if request is interpreter.NEED_INPUT:
+                    line = await self.read_input()
+                    continue
+                line = None
+                if interpreter.steps > self.max_steps:
+                    raise StepLimitExceeded(
+                        f"program ran more than {self.max_steps} statements"
+                    )
+                await asyncio.sleep(0)  # let other sessions run
+        finally:
+            execution.close()
+
+    async def flush(self, interpreter):
+        """Write output the program has produced since the last flush."""
+        output = interpreter.get_output()
+        while self.sent < len(output):
+            self.sent += 1
+            await self.write_output(output[self.sent - 1])
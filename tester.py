@@ -2,17 +2,32 @@
 Implements all CS 131-related test logic; is entry-point for testing framework.
 """
 
-import asyncio
+import argparse
 import importlib
-from os import environ
+from os import environ, execv, remove
+from os.path import exists
 import sys
-import traceback
+import json
+import io
+import threading
+from collections import OrderedDict
 from operator import itemgetter
 
+from archive import CorpusArchive
+from intbase import BufferInput
 from harness import (
     AbstractTestScaffold,
+    derive_timeouts,
+    request_test_results,
     run_all_tests,
+    run_process,
+    run_unless,
+    serve_tests,
     get_score,
+    merge_shard_results,
+    shard_tests,
+    snapshot_mtimes,
+    wait_for_changes,
     write_gradescope_output,
 )
 
@@ -20,25 +35,31 @@ from harness import (
 class TestScaffold(AbstractTestScaffold):
     """Implement scaffold for Brewin' interpreter; load file, validate syntax, run testcase."""
 
-    def __init__(self, interpreter_lib):
+    MAX_IDLE_PROGRAMS = 16
+
+    def __init__(self, interpreter_lib, archive=None):
         self.interpreter_lib = interpreter_lib
+        self.archive = archive
+        # program source -> idle Interpreters that already ran it (if REUSABLE),
+        # least recently used first
+        self.idle_interpreters = OrderedDict()
+        self.idle_lock = threading.Lock()
 
     def setup(self, test_case):
         inputfile, expfile, srcfile = itemgetter("inputfile", "expfile", "srcfile")(
             test_case
         )
+        # each file comes from the archive if it's packed (and current) there,
+        # otherwise from disk; hash_test_case in cache.py makes the same choice
+        expected = list(map(lambda x: x.rstrip("\n"), self.__read_lines(expfile)))
 
-        with open(expfile, encoding="utf-8") as handle:
-            expected = list(map(lambda x: x.rstrip("\n"), handle.readlines()))
-
-        try:
-            with open(inputfile, encoding="utf-8") as handle:
-                stdin = list(map(lambda x: x.rstrip("\n"), handle.readlines()))
-        except FileNotFoundError:
-            stdin = None
+        if self.archive is not None and inputfile in self.archive:
+            stdin = BufferInput(self.archive.buffer, *self.archive.span(inputfile))
+        else:
+            # pass the path along; InterpreterBase reads it lazily, line by line
+            stdin = inputfile if exists(inputfile) else None
 
-        with open(srcfile, encoding="utf-8") as handle:
-            program = handle.readlines()
+        program = self.__read_lines(srcfile)
 
         return {
             "expected": expected,
@@ -46,14 +67,56 @@ class TestScaffold(AbstractTestScaffold):
             "program": program,
         }
 
+    def __read_lines(self, path):
+        if self.archive is not None and path in self.archive:
+            # same newline handling as reading the loose file in text mode
+            return io.StringIO(str(self.archive.read(path), "utf-8"), None).readlines()
+        with open(path, encoding="utf-8") as handle:
+            return handle.readlines()
+
     def run_test_case(self, test_case, environment):
         expect_failure = itemgetter("expect_failure")(test_case)
         stdin, expected, program = itemgetter("stdin", "expected", "program")(
             environment
         )
-        interpreter = self.interpreter_lib.Interpreter(False, stdin, False)
+        interpreter, reused = self.__checkout_interpreter(program, stdin)
+        try:
+            return self.__run_interpreter(
+                interpreter, expect_failure, expected, program, not reused
+            )
+        finally:
+            self.__checkin_interpreter(program, interpreter)
+
+    def __checkout_interpreter(self, program, stdin):
+        """
+        Reuse an idle interpreter that already ran this program, if supported;
+        returns the interpreter and whether it was reused.
+        """
+        with self.idle_lock:
+            idle = self.idle_interpreters.get(tuple(program))
+            interpreter = idle.pop() if idle else None
+        if interpreter is None:
+            return self.interpreter_lib.Interpreter(False, stdin, False), False
+        interpreter.reset()
+        interpreter.set_input(stdin)
+        return interpreter, True
+
+    def __checkin_interpreter(self, program, interpreter):
+        if not getattr(interpreter, "REUSABLE", False):
+            return
+        key = tuple(program)
+        with self.idle_lock:
+            self.idle_interpreters.setdefault(key, []).append(interpreter)
+            self.idle_interpreters.move_to_end(key)
+            while len(self.idle_interpreters) > self.MAX_IDLE_PROGRAMS:
+                self.idle_interpreters.popitem(last=False)
+
+    @staticmethod
+    def __run_interpreter(interpreter, expect_failure, expected, program, validate):
+        # an interpreter being reused has already validated this exact program
         try:
-            interpreter.validate_program(program)
+            if validate:
+                interpreter.validate_program(program)
             interpreter.run(program)
         except Exception as exception:  # pylint: disable=broad-except
             if expect_failure:
@@ -66,6 +129,8 @@ class TestScaffold(AbstractTestScaffold):
                 print("\nReceived error:")
                 print(received)
 
+            import traceback  # pylint: disable=import-outside-toplevel
+
             print("\nException: ")
             print(exception)
             traceback.print_exc()
@@ -138,33 +203,340 @@ def generate_test_suite_v3():
     return __generate_test_suite(3, [], [])
 
 
-async def main():
-    """main entrypoint: argparses, delegates to test scaffold, suite generator, gradescope output"""
-    if not sys.argv:
-        raise ValueError("Error: Missing version number argument")
-    version = sys.argv[1]
-    module_name = f"interpreterv{version}"
-    interpreter = importlib.import_module(module_name)
-
-    scaffold = TestScaffold(interpreter)
-
+def parse_args(argv):
+    """Parse command-line arguments for the tester."""
+    parser = argparse.ArgumentParser(description="Run the Brewin' test suite.")
+    parser.add_argument("version", choices=["1", "2", "3"], help="project version")
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="reuse results for unchanged interpreter/test pairs",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="directory for the result cache (default: .grader_cache)",
+    )
+    parser.add_argument(
+        "--test",
+        action="append",
+        metavar="NAME",
+        help="only run the test with this name or srcfile (repeatable)",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        metavar="I/N",
+        help="only run the I-th (1-based) of N deterministic shards of the suite",
+    )
+    parser.add_argument(
+        "--runtimes",
+        metavar="FILE",
+        help="JSON of historical per-test runtimes, used to balance shards",
+    )
+    parser.add_argument(
+        "--record-runtimes",
+        metavar="FILE",
+        help="record this run's per-test runtimes into a JSON file",
+    )
+    parser.add_argument(
+        "--output",
+        default="results.json",
+        metavar="FILE",
+        help="name of the results file to write (default: results.json)",
+    )
+    parser.add_argument(
+        "--calibrate",
+        metavar="MODULE",
+        help="time a reference interpreter module on the suite and write --calibration",
+    )
+    parser.add_argument(
+        "--calibration",
+        metavar="FILE",
+        help="JSON of reference runtimes; when testing, derive per-test timeouts from it",
+    )
+    parser.add_argument(
+        "--timeout-multiplier",
+        type=float,
+        default=10,
+        help="per-test timeout as a multiple of reference runtime (default: 10)",
+    )
+    parser.add_argument(
+        "--timeout-floor",
+        type=float,
+        default=1,
+        help="minimum calibrated per-test timeout, in seconds (default: 1)",
+    )
+    parser.add_argument(
+        "--timeout-ceiling",
+        type=float,
+        default=10,
+        help="maximum calibrated per-test timeout, in seconds (default: 10)",
+    )
+    parser.add_argument(
+        "--merge",
+        nargs="+",
+        metavar="FILE",
+        help="merge shard results files into one results file instead of testing",
+    )
+    parser.add_argument(
+        "--serve",
+        type=int,
+        metavar="PORT",
+        help="keep the interpreter loaded and serve test jobs on a local port",
+    )
+    parser.add_argument(
+        "--connect",
+        type=int,
+        metavar="PORT",
+        help="run tests on a --serve process instead of loading the interpreter",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="stay running and re-run tests whenever the interpreter or tests change",
+    )
+    args = parser.parse_args(argv)
+    if args.calibrate and not args.calibration:
+        parser.error("--calibrate requires --calibration FILE to write to")
+    # cache hits don't run the test, so they'd leave holes in the recorded runtimes
+    if args.cache and args.record_runtimes:
+        parser.error("--cache cannot be combined with --record-runtimes")
+    if args.watch and args.cache:
+        parser.error("--cache cannot be combined with --watch")
+    if args.calibration and not args.calibrate and not exists(args.calibration):
+        parser.error(f"--calibration file {args.calibration} does not exist")
+    # every shard must agree on the partition, so never silently fall back to hashing
+    if args.runtimes and not exists(args.runtimes):
+        parser.error(f"--runtimes file {args.runtimes} does not exist")
+    for path in args.merge or []:
+        if not exists(path):
+            parser.error(f"shard results file {path} does not exist")
+    return args
+
+
+def parse_shard(value):
+    """Parse an I/N shard spec into a 0-based (index, count) pair."""
+    try:
+        index, count = map(int, value.split("/"))
+    except ValueError as exception:
+        raise argparse.ArgumentTypeError(f"expected I/N, got {value}") from exception
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"expected 1 <= I <= N, got {value}")
+    return index - 1, count
+
+
+def load_json(path, default=None):
+    """Load a JSON file, returning default if it does not exist."""
+    try:
+        with open(path, encoding="utf-8") as handle:
+            return json.load(handle)
+    except FileNotFoundError:
+        return default
+
+
+def generate_test_suite(version):
+    """Dispatch to the suite generator for a version."""
     match version:
         case "1":
-            tests = generate_test_suite_v1()
+            return generate_test_suite_v1()
         case "2":
-            tests = generate_test_suite_v2()
+            return generate_test_suite_v2()
         case "3":
-            tests = generate_test_suite_v3()
+            return generate_test_suite_v3()
         case _:
             raise ValueError("Unsupported version; expect one of 1,2,3")
 
-    results = await run_all_tests(scaffold, tests)
-    total_score = get_score(results) / len(results) * 100.0
-    print(f"Total Score: {total_score:9.2f}%")
+
+async def run_suite(args, tests):
+    """Run tests against the local interpreter, honoring cache/timeout/runtime flags."""
+    interpreter = importlib.import_module(f"interpreterv{args.version}")
+    scaffold = TestScaffold(interpreter, CorpusArchive.open_for_version(args.version))
+
+    cache = None
+    if args.cache:
+        # pylint: disable-next=import-outside-toplevel
+        from cache import DEFAULT_CACHE_DIR, ResultCache, hash_module_sources
+
+        cache = ResultCache(
+            hash_module_sources(interpreter),
+            args.cache_dir or DEFAULT_CACHE_DIR,
+            archive=scaffold.archive,
+        )
+    runtimes = {} if args.record_runtimes else None
+    results = await run_all_tests(
+        scaffold, tests, cache=cache, runtimes=runtimes, timeouts=load_timeouts(args)
+    )
+    if cache is not None:
+        cache.close()
+    if runtimes:
+        recorded = load_json(args.record_runtimes, {})
+        recorded.update(runtimes)
+        with open(args.record_runtimes, "w", encoding="utf-8") as handle:
+            json.dump(recorded, handle, indent=4, sort_keys=True)
+    return results
+
+
+async def calibrate(args, tests):
+    """Time the reference interpreter on every test and write the calibration file."""
+    reference = TestScaffold(
+        importlib.import_module(args.calibrate),
+        CorpusArchive.open_for_version(args.version),
+    )
+    runtimes = {}
+    results = await run_all_tests(reference, tests, runtimes=runtimes)
+    if get_score(results) < len(results):
+        print("Warning: reference interpreter failed some tests.")
+    with open(args.calibration, "w", encoding="utf-8") as handle:
+        json.dump(runtimes, handle, indent=4, sort_keys=True)
+    print(f"Wrote calibration for {len(runtimes)} tests to {args.calibration}.")
+
+
+def load_timeouts(args):
+    """Derive per-test timeouts from the calibration file, if one was given."""
+    if not args.calibration:
+        return None
+    return derive_timeouts(
+        load_json(args.calibration),
+        args.timeout_multiplier,
+        args.timeout_floor,
+        args.timeout_ceiling,
+    )
+
+
+def select_tests(args, tests):
+    """Narrow the suite down to the requested tests and shard."""
+    if args.test:
+        wanted = set(args.test)
+        tests = [
+            test for test in tests if test["name"] in wanted or test["srcfile"] in wanted
+        ]
+    if args.shard:
+        index, count = args.shard
+        runtimes = load_json(args.runtimes) if args.runtimes else None
+        tests = shard_tests(tests, index, count, runtimes)
+    return tests
+
+
+WATCH_RESULTS = ".watch_results.json"  # written by each --watch round's tester process
+
+
+async def watch(args, tests):
+    """
+    Re-run tests whenever the interpreter, the local modules it imports, or test
+    files change. Each round runs in a fresh tester process, which sees every
+    change and is killed (along with any hung test) as soon as anything changes
+    again. Previously failing tests and tests whose files changed run first.
+    """
+    from cache import local_module_paths  # pylint: disable=import-outside-toplevel
+
+    module_path = f"interpreterv{args.version}.py"
+    test_files = {
+        test["name"]: {test[key] for key in ("srcfile", "expfile", "inputfile")}
+        for test in tests
+    }
+    modules = [module_path]
+    failing = {test["name"] for test in tests}
+    changed = set()
+    command = [sys.executable, __file__, args.version, "--output", WATCH_RESULTS]
+    if args.calibration:
+        command += ["--calibration", args.calibration]
+        command += ["--timeout-multiplier", str(args.timeout_multiplier)]
+        command += ["--timeout-floor", str(args.timeout_floor)]
+        command += ["--timeout-ceiling", str(args.timeout_ceiling)]
+    # results go to WATCH_RESULTS in the working directory, even on prod
+    env = {name: value for name, value in environ.items() if name != "PROD"}
+
+    async def run_group(group):
+        if not group:
+            return []
+        tests_args = [arg for test in group for arg in ("--test", test["name"])]
+        code = await run_process(command + tests_args, env)
+        results = load_json(WATCH_RESULTS) if code == 0 else None
+        if exists(WATCH_RESULTS):
+            remove(WATCH_RESULTS)
+        return None if results is None else results["tests"]
+
+    async def run_round(first, rest):
+        for group in (first, rest):
+            results = await run_group(group)
+            if results is None:
+                print("Could not run tests; waiting for changes...")
+                return
+            failing.difference_update(test["name"] for test in group)
+            failing.update(result["name"] for result in results if not result["score"])
+        print(f"{len(tests) - len(failing)}/{len(tests)} tests passing.")
+        print("Waiting for changes...")
+
+    while True:
+        try:
+            modules = local_module_paths(module_path)
+        except (OSError, SyntaxError, ValueError):
+            pass  # keep watching the modules found last time until it parses again
+        mtimes = snapshot_mtimes(modules + sorted(set().union(*test_files.values())))
+
+        first = [
+            test
+            for test in tests
+            if test["name"] in failing or test_files[test["name"]] & changed
+        ]
+        rest = [test for test in tests if test not in first]
+        finished, change = await run_unless(
+            run_round(first, rest), wait_for_changes(mtimes)
+        )
+        if not finished:
+            print("\nChange detected; restarting...")
+        changed, _ = await change
+        print(f"Changed: {', '.join(sorted(changed))}")
+
+
+def main():
+    """main entrypoint: argparses, delegates to test scaffold, suite generator, gradescope output"""
+    args = parse_args(sys.argv[1:])
+    tests = generate_test_suite(args.version)
+
+    if args.merge:
+        results = merge_shard_results(map(load_json, args.merge), tests)
+    else:
+        tests = select_tests(args, tests)
+        if args.connect:
+            results = request_test_results(tests, args.connect)
+        else:
+            import asyncio  # pylint: disable=import-outside-toplevel
+
+            if args.calibrate:
+                asyncio.run(calibrate(args, tests))
+                return
+            if args.watch:
+                try:
+                    asyncio.run(watch(args, tests))
+                except KeyboardInterrupt:
+                    pass
+                return
+            if args.serve:
+                interpreter = importlib.import_module(f"interpreterv{args.version}")
+                if asyncio.run(
+                    serve_tests(
+                        TestScaffold(
+                            interpreter, CorpusArchive.open_for_version(args.version)
+                        ),
+                        tests,
+                        args.serve,
+                        timeouts=load_timeouts(args),
+                    )
+                ):
+                    # start over in a fresh process, dropping the hung test threads
+                    sys.stdout.flush()
+                    execv(sys.executable, [sys.executable, *sys.argv])
+                return
+            results = asyncio.run(run_suite(args, tests))
+
+    if results:
+        total_score = get_score(results) / len(results) * 100.0
+        print(f"Total Score: {total_score:9.2f}%")
 
     # flag that toggles write path for results.json
-    write_gradescope_output(results, environ.get("PROD", False))
+    write_gradescope_output(results, environ.get("PROD", False), args.output)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()